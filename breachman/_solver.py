@@ -0,0 +1,123 @@
+"""
+Depth-first search over a puzzle using plain state tuples instead of ``Node`` objects.
+
+Moves follow the same rules as ``Node``, from ``Puzzle.candidates``. A state holds the last selected position, the
+selection type, a bitmask of used positions, the solved count of each unlock sequence and the remaining buffer.
+Nothing is allocated per visited state except those tuples, and results are memoized on the state.
+"""
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+from .core import SequenceState
+
+if TYPE_CHECKING:
+    from .core import Node, Puzzle, SelectionType
+
+# (last_position, selection_type, used_mask, solved_counts, budget)
+State = Tuple[Optional[int], 'SelectionType', int, Tuple[int, ...], int]
+
+
+class Search:
+    def __init__(self, puzzle: 'Puzzle'):
+        self.puzzle = puzzle
+        self.sequences = puzzle.sequence_codes
+        self.codes = puzzle.grid.position_codes
+        # state -> the positions that can follow it to complete every unlock sequence
+        self.solution_suffixes: Dict[State, Tuple[Tuple[int, ...], ...]] = {}
+        # a state known to be unwinnable, minus its budget -> the largest budget it was exhausted with
+        self.unsolvable: Dict[Tuple[Optional[int], 'SelectionType', int, Tuple[int, ...]], int] = {}
+
+    @staticmethod
+    def state_of(node: 'Node') -> State:
+        return (
+            node.last_selection,
+            node.selection_type,
+            node.buffer.used_mask,
+            node.record.solved_counts,
+            node.max_size - len(node.buffer),
+        )
+
+    def is_complete(self, solved_counts: Tuple[int, ...]) -> bool:
+        return all(count == len(seq) for count, seq in zip(solved_counts, self.sequences))
+
+    def expand(self, state: State) -> Tuple[State, ...]:
+        """
+        The states reachable in one move from ``state``
+        """
+        last_position, selection, used_mask, solved_counts, budget = state
+        next_selection = 'col' if selection == 'row' else 'row'
+        advance, sequences, codes = SequenceState.advance, self.sequences, self.codes
+        children = []
+        for position in self.puzzle.candidates(last_position, selection, used_mask, solved_counts, budget):
+            child_counts = advance(solved_counts, sequences, codes[position])
+            children.append((position, next_selection, used_mask | 1 << position, child_counts, budget - 1))
+        return tuple(children)
+
+    def suffixes(self, state: State) -> Tuple[Tuple[int, ...], ...]:
+        """
+        The positions that can follow ``state`` to complete every unlock sequence.
+
+        Walks the tree with an explicit stack rather than recursion: a state stays on the stack until all of its
+        children have results, then its own result is built from theirs.
+        """
+        memo = self.solution_suffixes
+        stack = [(state, None)]
+        while stack:
+            current, children = stack[-1]
+            if current in memo:
+                stack.pop()
+                continue
+            if children is None:
+                children = self.expand(current)
+                stack[-1] = (current, children)
+                pending = [(child, None) for child in children if child not in memo]
+                if pending:
+                    stack.extend(pending)
+                    continue
+            stack.pop()
+            found = [()] if self.is_complete(current[3]) else []
+            for child in children:
+                found.extend((child[0],) + suffix for suffix in memo[child])
+            memo[current] = tuple(found)
+        return memo[state]
+
+    def dominated(self, state: State) -> bool:
+        """
+        Whether ``state`` only differs from a state already found to be unwinnable by having less buffer left.
+        Any win from ``state`` would also be a win from that one. A single dict lookup, so it is cheap enough to
+        check before every expansion.
+        """
+        return self.unsolvable.get(state[:4], -1) >= state[4]
+
+    def first_solution(self, state: State) -> Optional[Tuple[int, ...]]:
+        """
+        The positions of the first sequence of moves from ``state`` that completes every unlock sequence, in the same
+        order ``suffixes`` lists them, or ``None`` if there isn't one.
+
+        Walks the tree with an explicit stack of (state, remaining children) rather than recursion, so finding a win
+        returns straight away instead of unwinding every frame above it. The stack doubles as the path to the win.
+        """
+        if self.is_complete(state[3]):
+            return ()
+        if self.dominated(state):
+            return None
+        stack = [(state, iter(self.expand(state)))]
+        while stack:
+            current, remaining = stack[-1]
+            for child in remaining:
+                if self.is_complete(child[3]):
+                    return tuple(entry[0][0] for entry in stack[1:]) + (child[0],)
+                if not self.dominated(child):
+                    stack.append((child, iter(self.expand(child))))
+                    break
+            else:
+                # every child is exhausted without a win, so this state can't be won either
+                stack.pop()
+                key = current[:4]
+                self.unsolvable[key] = max(self.unsolvable.get(key, -1), current[4])
+        return None
+
+    def solvable(self, state: State) -> bool:
+        """
+        Whether any sequence of moves from ``state`` completes every unlock sequence
+        """
+        return self.first_solution(state) is not None
@@ -1,5 +1,5 @@
-from typing import Sequence, Literal, Union, Optional
-from collections import Counter
+from typing import Sequence, Literal, Union, Optional, List, Tuple, Dict, NamedTuple
+from itertools import islice
 
 EXAMPLE_MATRIX = [
     ["1C", "E9", "1C", "55", "1C"],
@@ -16,39 +16,49 @@ EXAMPLE_UNLOCK_SEQUENCES = (
 )
 
 
-class Tile:
-    __slots__ = ['val', 'row', 'col']
+class Tile(NamedTuple):
+    """
+    A value and where it is on the grid. Only used for display; everything else refers to tiles by their position,
+    ``row * width + col``.
+    """
 
-    def __init__(self, val: str, row: int, col: int):
-        self.val = val
-        self.row = row
-        self.col = col
-
-    def __eq__(self, other: Union['Tile']):
-        return hash(self) == hash(other)
-
-    def __hash__(self):
-        return hash((self.row, self.col))
-
-    def __repr__(self):
-        return f'{self.__class__.__name__}(val={self.val!r}, row={self.row!r}, col={self.col!r})'
+    val: str
+    row: int
+    col: int
 
     def __str__(self):
         return str(self.val)
 
 
 class Buffer:
-    __slots__ = ['state', '_buff_set']
+    __slots__ = ['state', 'codes', 'used_mask']
 
-    def __init__(self, state: Optional[Sequence[Tile]] = None):
+    def __init__(
+        self,
+        state: Optional[Sequence[int]] = None,
+        codes: Optional[Sequence[int]] = None,
+        used_mask: Optional[int] = None,
+    ):
+        """
+        :param state: the selected positions, in order
+        :param codes: the code of the value at each of those positions, see ``Grid.position_codes``
+        :param used_mask: bitmask of ``state``; computed if not given
+        """
         self.state = tuple(state) if state is not None else tuple()
-        self._buff_set = set(self.state)
+        self.codes = tuple(codes) if codes is not None else tuple()
+        if len(self.codes) != len(self.state):
+            raise ValueError('Buffer needs exactly one code per position')
+        if used_mask is None:
+            used_mask = 0
+            for position in self.state:
+                used_mask |= 1 << position
+        self.used_mask = used_mask
 
-    def __contains__(self, item):
-        return item in self._buff_set
+    def __contains__(self, item: int):
+        return self.used_mask >> item & 1 == 1
 
-    def add(self, other: Tile):
-        return Buffer(self.state + (other,))
+    def add(self, position: int, code: int):
+        return Buffer(self.state + (position,), self.codes + (code,), self.used_mask | 1 << position)
 
     def __iter__(self):
         for i in self.state:
@@ -65,28 +75,26 @@ class Buffer:
 
 
 class Grid:
-    __slots__ = ['rows', 'columns']
+    __slots__ = ['width', 'values', 'codes', 'position_codes', 'rows', 'columns', 'tiles']
 
     def __init__(self, matrix):
-        self.rows = []
-        for row_index, row in enumerate(matrix):
-            r = []
-            for col_index, val in enumerate(row):
-                tile = Tile(val, row_index, col_index)
-                r.append(tile)
-            self.rows.append(r)
-        self.columns = [[] for _ in range(len(self.rows))]
-        for index, col in enumerate(self.columns):
-            for row in self.rows:
-                for tile in row:
-                    if tile.col == index:
-                        col.append(tile)
+        # tiles are referred to by position, ``row * width + col``
+        self.width = len(matrix[0])
+        self.values = [val for row in matrix for val in row]
+        # each distinct value gets a small integer code so comparisons during a search are int comparisons
+        self.codes = {}
+        self.position_codes = [self.codes.setdefault(val, len(self.codes)) for val in self.values]
+        self.rows = [
+            list(range(row_index * self.width, (row_index + 1) * self.width)) for row_index in range(len(matrix))
+        ]
+        self.columns = [[row[col_index] for row in self.rows] for col_index in range(self.width)]
+        self.tiles = [Tile(val, *divmod(position, self.width)) for position, val in enumerate(self.values)]
 
     def __getitem__(self, item):
         return self.rows[item]
 
     def __repr__(self):
-        return repr(self.rows)
+        return repr([[self.values[position] for position in row] for row in self.rows])
 
     def get_col(self, index):
         return self.columns[index]
@@ -94,29 +102,54 @@ class Grid:
     def get_row(self, index):
         return self.rows[index]
 
+    def encode(self, values: Sequence[str]) -> Tuple[int, ...]:
+        """
+        Translate values to the codes used by this grid. Values that are not in the grid get ``-1``,
+        which never matches a tile.
+        """
+        return tuple(self.codes.get(val, -1) for val in values)
+
 
 class SequenceState:
-    def __init__(self, seq: Sequence[str], buff: Buffer, max_size: int):
+    def __init__(self, seq: Sequence[str], buff: Buffer, max_size: int, codes: Sequence[int]):
+        """
+        :param seq: the unlock sequence
+        :param buff: the buffer to match it against
+        :param max_size: the size of the buffer
+        :param codes: ``seq`` encoded with ``Grid.encode``
+        """
         self.seq = seq
         self.failed = False
         self.success = False
         self._solved_count = 0
-        first = seq[0]
-        for index, tile in enumerate(buff, start=0):
-            if tile.val == first:
-                self._solved_count = 1
-                break
-        else:
+        buffer_codes = buff.codes
+        first = codes[0]
+        if first not in buffer_codes:
             return
-        for index, tile in enumerate(buff[index + 1 :], start=index):
-            if tile.val == self.seq[self._solved_count]:
-                self._solved_count += 1
-                if self._solved_count == len(seq):
-                    self.success = True
-                    return
-            elif max_size < self._solved_count + self.remaining:
+        seq_len = len(codes)
+        solved_count = 1
+        for code in islice(buffer_codes, buffer_codes.index(first) + 1, None):
+            if solved_count == seq_len:
+                break
+            if code == codes[solved_count]:
+                solved_count += 1
+            elif max_size < seq_len:
                 self.failed = True
-                return
+                break
+        self._solved_count = solved_count
+        self.success = solved_count == seq_len
+
+    @classmethod
+    def advance(cls, solved_counts: Tuple[int, ...], sequence_codes: Sequence[Sequence[int]], code: int):
+        """
+        The solved count of each sequence once a tile with ``code`` is added to a buffer with ``solved_counts``.
+
+        Sequences are matched greedily, so this gives the same counts as rescanning the whole buffer.
+        """
+        return tuple(
+            count + 1 if count < len(codes) and codes[count] == code else count
+            for count, codes in zip(solved_counts, sequence_codes)
+        )
 
     @property
     def remaining(self):
@@ -129,60 +162,200 @@ class SequenceState:
 SelectionType = Union[Literal['row', 'col'], str]
 
 
+class Puzzle:
+    """
+    The parts of a game that never change while playing or searching it. Every node of a game shares one instance.
+    """
+    __slots__ = ['grid', 'unlock_sequences', 'max_size', 'sequence_codes']
+
+    def __init__(self, grid: Grid, unlock_sequences: Sequence[Sequence[str]], max_size: int):
+        self.grid = grid
+        self.unlock_sequences = unlock_sequences
+        self.max_size = max_size
+        self.sequence_codes = tuple(grid.encode(seq) for seq in unlock_sequences)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(grid={self.grid!r}, unlock_sequences={self.unlock_sequences!r}, '
+            f'max_size={self.max_size!r})'
+        )
+
+    # The move rules. ``Node`` and the solver in ``_solver`` both use these, so they live in one place.
+
+    def choices(self, last_selection: Optional[int], selection_type: SelectionType, used_mask: int) -> Sequence[int]:
+        """
+        The positions that can be selected next: the first row to start with, then the row or column of the last
+        selection, without any previously selected tiles
+        """
+        grid = self.grid
+        if last_selection is None:
+            return grid[0]
+        row, col = divmod(last_selection, grid.width)
+        if selection_type == 'row':
+            elements = grid.get_row(row)
+        else:
+            elements = grid.get_col(col)
+        return [i for i in elements if not used_mask >> i & 1]
+
+    def prime_choices(self, choices: Sequence[int], solved_counts: Tuple[int, ...]) -> List[int]:
+        """
+        The ``choices`` that advance an unfinished unlock sequence, ordered by how many sequences they advance
+        """
+        unlock_counts = {}
+        for count, codes in zip(solved_counts, self.sequence_codes):
+            if count < len(codes):
+                unlock_counts[codes[count]] = unlock_counts.get(codes[count], 0) + 1
+        if not unlock_counts:
+            return []
+        # counts are bounded by the number of sequences, so bucket the choices instead of sorting them
+        buckets = [[] for _ in range(max(unlock_counts.values()) + 1)]
+        position_codes = self.grid.position_codes
+        for c in choices:
+            count = unlock_counts.get(position_codes[c])
+            if count:
+                buckets[count].append(c)
+        return [c for bucket in reversed(buckets) for c in bucket]
+
+    def candidates(
+        self,
+        last_selection: Optional[int],
+        selection_type: SelectionType,
+        used_mask: int,
+        solved_counts: Tuple[int, ...],
+        budget: int,
+    ) -> Sequence[int]:
+        """
+        The moves worth exploring with ``budget`` buffer slots left: the ``choices``, narrowed to ``prime_choices``
+        for the last slot
+        """
+        if budget == 0:
+            return []
+        # nothing further can win if any sequence needs more tiles than the buffer has room for
+        for count, codes in zip(solved_counts, self.sequence_codes):
+            if len(codes) - count > budget:
+                return []
+        choices = self.choices(last_selection, selection_type, used_mask)
+        if budget == 1:
+            return self.prime_choices(choices, solved_counts)
+        return choices
+
+
+class LiteNode:
+    """
+    The compact record kept for an explored node: its parent's record, the position of the last selected tile and
+    how far along each unlock sequence is. Child nodes are remembered only as the positions they select.
+    """
+    __slots__ = ['parent', 'position', 'solved_counts', 'children_moves']
+
+    def __init__(self, parent: Optional['LiteNode'], position: Optional[int], solved_counts: Tuple[int, ...]):
+        self.parent = parent
+        self.position = position
+        self.solved_counts = solved_counts
+        self.children_moves: Optional[List[int]] = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(position={self.position!r}, solved_counts={self.solved_counts!r})'
+
+
 class Node:
+    __slots__ = [
+        'puzzle',
+        'buffer',
+        'record',
+        'success_mask',
+        'last_selection',
+        'selection_type',
+        'next_selection_type',
+        '_choices',
+        '_next_unlocks',
+        '_sequence_states',
+    ]
+
     def __init__(
         self,
-        grid: Grid,
+        puzzle: Puzzle,
         buffer_state: Buffer,
-        max_size: int,
-        unlock_sequences: Sequence[Sequence[str]],
         selection_type: SelectionType = 'row',
+        parent: Optional[LiteNode] = None,
     ):
-
-        self.sequence_states = [SequenceState(seq, buffer_state, max_size=max_size) for seq in unlock_sequences]
-
-        self._children = None
+        self.puzzle = puzzle
         self._choices = None
+        self._next_unlocks = None
+        self._sequence_states = None
         self.buffer = buffer_state
         if buffer_state:
             self.last_selection = buffer_state[-1]
         else:
             self.last_selection = None
-        self.unlock_sequences = unlock_sequences
-        self.max_size = max_size
         self.selection_type = selection_type
         if selection_type == 'row':
             self.next_selection_type = 'col'
         else:
             self.next_selection_type = 'row'
-        self.grid = grid
-        self.children
+        last_selection = self.last_selection
+        if parent is not None:
+            # a child's progress only depends on its parent's progress and the tile it adds
+            solved_counts = SequenceState.advance(
+                parent.solved_counts, puzzle.sequence_codes, puzzle.grid.position_codes[last_selection]
+            )
+        else:
+            solved_counts = tuple(state._solved_count for state in self.sequence_states)
+        self.record = LiteNode(parent, last_selection, solved_counts)
+        # bit i is set once unlock sequence i is complete
+        self.success_mask = 0
+        for index, (count, codes) in enumerate(zip(solved_counts, puzzle.sequence_codes)):
+            if count == len(codes):
+                self.success_mask |= 1 << index
+
+    @property
+    def sequence_states(self) -> List[SequenceState]:
+        """
+        The full match state of each unlock sequence, for display. Built by scanning the buffer, so only on request;
+        moving through the tree only needs ``record.solved_counts``.
+        """
+        if self._sequence_states is None:
+            self._sequence_states = [
+                SequenceState(seq, self.buffer, max_size=self.max_size, codes=codes)
+                for seq, codes in zip(self.unlock_sequences, self.puzzle.sequence_codes)
+            ]
+        return self._sequence_states
+
+    @property
+    def grid(self) -> Grid:
+        return self.puzzle.grid
+
+    @property
+    def unlock_sequences(self) -> Sequence[Sequence[str]]:
+        return self.puzzle.unlock_sequences
+
+    @property
+    def max_size(self) -> int:
+        return self.puzzle.max_size
 
     @property
     def children(self) -> Sequence['Node']:
-        if self._children is not None:
-            return self._children
-        children = []
-        for candidate in self.next_candidates or []:
-            node = Node(
-                grid=self.grid,
-                buffer_state=self.buffer.add(candidate),
-                max_size=self.max_size,
-                unlock_sequences=self.unlock_sequences,
+        """
+        Child nodes, built on demand. Only the moves are remembered (on ``self.record``), so holding a node does not
+        keep its whole subtree alive.
+        """
+        record = self.record
+        if record.children_moves is None:
+            record.children_moves = list(self.next_candidates or [])
+        position_codes = self.grid.position_codes
+        return [
+            Node(
+                self.puzzle,
+                self.buffer.add(position, position_codes[position]),
                 selection_type=self.next_selection_type,
+                parent=record,
             )
-            children.append(node)
-        self._children = children
-        return children
-
-    @property
-    def sequence_index(self):
-        return len(self.buffer) + 1
+            for position in record.children_moves
+        ]
 
     @property
-    def next_unlocks(self) -> Counter:
+    def next_unlocks(self) -> Dict[str, int]:
         """
-        Returns the counts of next values we're looking for at the current index in each unlock sequence
+        Returns the counts of the next value we're looking for in each unfinished unlock sequence
 
         For example, on the first round of the ``EXAMPLE_UNLOCK_SEQUENCES``, this would return:
 
@@ -193,56 +366,50 @@ class Node:
         }
 
         """
-        unlock_tiles = Counter()
-        unlock_index = self.sequence_index
-        for seq in self.unlock_sequences:
-            if unlock_index > len(seq) - 1:
-                continue
-            unlock_tiles[seq[unlock_index]] += 1
+        if self._next_unlocks is not None:
+            return self._next_unlocks
+        unlock_tiles = {}
+        for seq, solved_count in zip(self.unlock_sequences, self.record.solved_counts):
+            if solved_count < len(seq):
+                val = seq[solved_count]
+                unlock_tiles[val] = unlock_tiles.get(val, 0) + 1
+        self._next_unlocks = unlock_tiles
         return unlock_tiles
 
     @property
-    def prime_candidates(self) -> Union[None, Sequence[Tile]]:
+    def prime_candidates(self) -> Union[None, Sequence[int]]:
         """
         Candidates who are included in a next unlock, ordered by the number of unlocks the choice would unlock
         """
-        unlock_counts = self.next_unlocks
-        if not unlock_counts:
+        if not self.next_unlocks:
             return None
-        choices = self.choices
-        return sorted([c for c in choices if c in unlock_counts], key=unlock_counts.get, reverse=True)
+        return self.puzzle.prime_choices(self.choices, self.record.solved_counts)
 
     @property
-    def choices(self) -> Sequence[Tile]:
+    def choices(self) -> Sequence[int]:
         """
-        Returns the possible tiles we have to choose from, filtering out any previously selected tiles
+        Returns the positions we have to choose from, filtering out any previously selected tiles
         """
-        if self._choices is not None:
-            return self._choices
-        last_selection = self.last_selection
-        if not last_selection:
-            return self.grid[0]
-        if self.selection_type == 'row':
-            elements = self.grid.get_row(last_selection.row)
-        else:
-            elements = self.grid.get_col(last_selection.col)
-        choices = [i for i in elements if i not in self.buffer]
-        self._choices = choices
-        return choices
+        if self._choices is None:
+            self._choices = self.puzzle.choices(self.last_selection, self.selection_type, self.buffer.used_mask)
+        return self._choices
 
     @property
-    def next_candidates(self) -> Union[None, Sequence[Tile]]:
+    def next_candidates(self) -> Union[None, Sequence[int]]:
         """
         Like ``choices``, but try to optimize things
         """
-        curr_size = len(self.buffer)
-        max_size = self.max_size
-        if curr_size == max_size:
-            return None
-        if curr_size == max_size - 1:
-            return self.prime_candidates or None
-        return self.choices
+        return (
+            self.puzzle.candidates(
+                self.last_selection,
+                self.selection_type,
+                self.buffer.used_mask,
+                self.record.solved_counts,
+                self.max_size - len(self.buffer),
+            )
+            or None
+        )
 
     @property
     def is_complete(self):
-        return all(state.success for state in self.sequence_states)
+        return self.success_mask == (1 << len(self.unlock_sequences)) - 1
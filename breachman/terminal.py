@@ -1,7 +1,17 @@
+import sys
+from typing import Optional, Tuple
 from .core import *
+from ._solver import Search
 import colorama
 colorama.init()
 
+RED = colorama.Fore.RED
+GREEN = colorama.Fore.GREEN
+CYAN = colorama.Fore.CYAN
+RESET = colorama.Style.RESET_ALL
+RESET_BRIGHT = colorama.Style.RESET_ALL + colorama.Style.BRIGHT
+BRIGHT_YELLOW = colorama.Style.BRIGHT + colorama.Fore.YELLOW
+
 ###################
 ###################
 #  Terminal mode  #
@@ -9,97 +19,113 @@ colorama.init()
 ###################
 
 
-def _print_states(states):
-    print('UNLOCK_SEQUENCES:')
+def _format_states(states) -> str:
+    parts = ['UNLOCK_SEQUENCES:\n']
     for reward_level, state in enumerate(states, start=1):
         if state.failed:
-            print(colorama.Fore.RED + ' '.join(state.seq) + f' REWARD: v{reward_level} (FAILED)' + colorama.Style.RESET_ALL)
+            parts.append(RED + ' '.join(state.seq) + f' REWARD: v{reward_level} (FAILED)' + RESET + '\n')
         elif state.success:
-            print(colorama.Fore.GREEN + ' '.join(state.seq) + f' REWARD: v{reward_level} (COMPLETE)' + colorama.Style.RESET_ALL)
+            parts.append(GREEN + ' '.join(state.seq) + f' REWARD: v{reward_level} (COMPLETE)' + RESET + '\n')
         else:
             for index, combo in enumerate(state.seq, start=1):
                 if index <= state._solved_count:
-                    print(colorama.Fore.GREEN + combo, end=' ')
+                    parts.append(GREEN + combo + ' ')
                 else:
-                    print(colorama.Style.RESET_ALL + colorama.Style.BRIGHT + combo, end=' ')
-            print(colorama.Style.RESET_ALL)
+                    parts.append(RESET_BRIGHT + combo + ' ')
+            parts.append(RESET + '\n')
+    return ''.join(parts)
 
 
-def _color_for_tiles(tiles: Sequence[Tile], node: Node):
-    for t in tiles:
-        if t in node.buffer:
-            yield colorama.Fore.CYAN + t.val + colorama.Style.RESET_ALL
-        elif t in node.choices:
-            yield colorama.Style.BRIGHT + colorama.Fore.YELLOW + t.val + colorama.Style.RESET_ALL
+def _color_for_tiles(positions: Sequence[int], values: Sequence[str], buffer_mask: int, choices_mask: int):
+    for p in positions:
+        if buffer_mask >> p & 1:
+            yield CYAN + values[p] + RESET
+        elif choices_mask >> p & 1:
+            yield BRIGHT_YELLOW + values[p] + RESET
         else:
-            yield t.val
-
-
-def _print_matrix(node):
-    # print row values
-    for row in node.grid.rows:
-        print("| ", end='')
-        print(*_color_for_tiles(row, node), sep=' | ', end=" |\n")
-    # print board separator
-    seps = ["_"] * len(node.grid.columns)
-    print("__", end='')
-    print(*seps, sep='___', end='__\n')
-
-def _print_buffer(buff, max_size):
-    print('CURRENT BUFFER:')
+            yield values[p]
+
+
+def _format_matrix(node) -> str:
+    values = node.grid.values
+    buffer_mask = node.buffer.used_mask
+    choices_mask = 0
+    for p in node.choices:
+        choices_mask |= 1 << p
+    # row values
+    parts = [
+        '| ' + ' | '.join(_color_for_tiles(row, values, buffer_mask, choices_mask)) + ' |\n' for row in node.grid.rows
+    ]
+    # board separator
+    parts.append('__' + '___'.join(['_'] * len(node.grid.columns)) + '__\n')
+    return ''.join(parts)
+
+def _format_buffer(buff, grid, max_size) -> str:
+    parts = ['CURRENT BUFFER:\n']
     for i in range(1, max_size+1):
         if i <= len(buff.state):
-            print(colorama.Fore.CYAN + str(buff.state[i-1]) + colorama.Style.RESET_ALL, end=' ')
+            parts.append(CYAN + grid.values[buff.state[i-1]] + RESET + ' ')
         else:
-            print([], end=' ')
-    print()
+            parts.append('[] ')
+    parts.append('\n')
+    return ''.join(parts)
+
+
+def _print_frame(node, max_size):
+    # one write per redraw; every write is a syscall, and an expensive one through colorama's wrapper on Windows
+    sys.stdout.write(
+        _format_states(node.sequence_states)
+        + _format_matrix(node)
+        + _format_buffer(node.buffer, node.grid, max_size=max_size)
+    )
 
 
 def _validate_node(node: Node) -> bool:
-    if node.is_complete:
-        return True
-    children = node.children
-    for child in children:
-        if child.is_complete:
-            return True
-    else:
-        return any(_validate_node(child) for child in children)
+    search = Search(node.puzzle)
+    return search.solvable(search.state_of(node))
 
 def play(grid, seq, max_size=8):
-    node = Node(grid=Grid(grid), unlock_sequences=seq, buffer_state=Buffer(), max_size=max_size)
+    puzzle = Puzzle(Grid(grid), unlock_sequences=seq, max_size=max_size)
+    node = Node(puzzle, Buffer())
     if _validate_node(node) is not True:
         raise ValueError("Invalid grid no winning moves!~")
-    while node.children:
-        _print_states(node.sequence_states)
-        _print_matrix(node)
-        _print_buffer(node.buffer, max_size=max_size)
+    # children are built on every access, so read them once per turn
+    choices = node.children
+    while choices:
+        _print_frame(node, max_size=max_size)
 
-        choices = node.children
-        for index, n in enumerate(choices):
-            print(index, n.last_selection)
+        sys.stdout.write(''.join(f'{index} {node.grid.values[n.last_selection]}\n' for index, n in enumerate(choices)))
         choice = int(input('Choose one: '))
         # TODO: validate input
         node = choices[choice]
         if node.is_complete:
-            _print_states(node.sequence_states)
-            _print_matrix(node)
-            _print_buffer(node.buffer, max_size=max_size)
+            _print_frame(node, max_size=max_size)
             print("YOU WIN!")
             return
+        choices = node.children
     print('You suck :(')
 
 def _solve(node: Node):
-    solutions = []
-    if node.is_complete:
-        solutions.append(node.buffer.state)
-    for child in node.children:
-        solutions.extend(_solve(child))
-    return solutions
+    search = Search(node.puzzle)
+    return [node.buffer.state + suffix for suffix in search.suffixes(search.state_of(node))]
+
+
+def _solve_first(node: Node) -> Optional[Tuple[int, ...]]:
+    search = Search(node.puzzle)
+    suffix = search.first_solution(search.state_of(node))
+    if suffix is None:
+        return None
+    return node.buffer.state + suffix
 
 
 def solve_grid(grid, seq, max_size):
-    node = Node(grid=Grid(grid), unlock_sequences=seq, buffer_state=Buffer(), max_size=max_size)
-    for t in _solve(node)[0]:
+    grid = Grid(grid)
+    node = Node(Puzzle(grid, unlock_sequences=seq, max_size=max_size), Buffer())
+    solution = _solve_first(node)
+    if solution is None:
+        raise ValueError("Invalid grid no winning moves!~")
+    for position in solution:
+        t = grid.tiles[position]
         print(t.val, (t.col, t.row))
 
 